@@ -2,8 +2,13 @@
 # Original license: MIT
 # Modified by https://github.com/mlloliveira 
 
-import random
-import string
+import atexit
+import os
+import queue
+import secrets
+import threading
+import time
+from pathlib import Path
 import streamlit as st
 from code_editor import code_editor
 
@@ -13,8 +18,116 @@ state = st.session_state
 
 def _short_id(length: int = 16) -> str:
     """Generate a short random id (used for editor keys)."""
-    alphabet = string.ascii_letters + string.digits
-    return "".join(random.choices(alphabet, k=length))
+    # token_urlsafe yields ~1.3 chars per byte, so `length` bytes is plenty
+    return secrets.token_urlsafe(length)[:length]
+
+
+# -------------------------------------------------------------------
+# Background autosave
+# -------------------------------------------------------------------
+# This module is imported once per process, unlike the Streamlit script
+# which is re-executed on every rerun, so the writer thread lives here.
+
+AUTOSAVE_DEBOUNCE_SECONDS = 1.0
+
+# (path, text) to write, or None to end the current batch right away
+_write_q: "queue.Queue[tuple[str, str] | None]" = queue.Queue()
+# path -> text last written there
+_last_written: dict[str, str] = {}
+# path -> last write error, reported on the next autosave call
+_autosave_errors: dict[str, Exception] = {}
+
+
+def _write(path: str, text: str) -> None:
+    """Write `text` to `path` unless it is what was last written there."""
+    if _last_written.get(path) == text and os.path.exists(path):
+        # Unchanged since the last write, and still on disk
+        return
+    # Write to a temp file and swap it in, so a crash never truncates `path`
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except Exception as e:
+        _autosave_errors[path] = e
+    else:
+        _last_written[path] = text
+
+
+def _writer_loop() -> None:
+    """
+    Consume the write queue forever.
+
+    Requests arriving within the debounce window of the first one are
+    batched, keeping only the latest text per path, then written.
+    """
+    while True:
+        item = _write_q.get()
+        batch: dict[str, str] = {}
+        received = 1
+        deadline = time.monotonic() + AUTOSAVE_DEBOUNCE_SECONDS
+        while item is not None:
+            path, text = item
+            batch[path] = text
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _write_q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            received += 1
+        for path, text in batch.items():
+            _write(path, text)
+        for _ in range(received):
+            _write_q.task_done()
+
+
+def autosave(path: str, text: str) -> Exception | None:
+    """
+    Queue `text` to be written to `path` by the background writer.
+
+    Returns immediately. Returns the error of a previous failed write to
+    `path`, if any.
+    """
+    _write_q.put((path, text))
+    return _autosave_errors.pop(path, None)
+
+
+def autosave_flush_now() -> None:
+    """Write pending autosaves without waiting for the debounce window."""
+    if not _write_q.unfinished_tasks:
+        # Nothing queued or being written
+        return
+    _write_q.put(None)
+    _write_q.join()
+
+
+threading.Thread(target=_writer_loop, name="mini-notebook-autosave", daemon=True).start()
+atexit.register(autosave_flush_now)
+
+
+# -------------------------------------------------------------------
+# Cached autoload
+# -------------------------------------------------------------------
+
+# path -> (mtime, size, text) as of the last read
+_autoload_cache: dict[str, tuple[float, int, str]] = {}
+
+
+def read_text_cached(path: str) -> str:
+    """
+    Read a UTF-8 text file, reusing the previous read while its mtime and
+    size are unchanged. Raises FileNotFoundError if `path` doesn't exist.
+    """
+    info = os.stat(path)
+    cached = _autoload_cache.get(path)
+    if cached is not None and cached[0] == info.st_mtime and cached[1] == info.st_size:
+        return cached[2]
+    text = Path(path).read_text(encoding="utf-8")
+    _autoload_cache[path] = (info.st_mtime, info.st_size, text)
+    return text
 
 
 class editor_output_parser:
@@ -28,14 +141,19 @@ class editor_output_parser:
     def __init__(self, initial_code: str = ""):
         self.last_id = None
         self.last_code = initial_code
+        self._last_output = None
 
     def __call__(self, output):
-        if output is None:
+        if output is None or output is self._last_output:
             # No new interaction: keep last contents, no event
             return None, self.last_code
+        self._last_output = output
 
         # New code text from the editor
-        self.last_code = output.get("text", self.last_code)
+        try:
+            self.last_code = output["text"]
+        except KeyError:
+            pass
 
         event = None
         out_id = output.get("id")
@@ -105,51 +223,64 @@ class Editor:
         self.min_lines = min_lines
         self.max_lines = max_lines
         self.event: str | None = None
-        self._parser = editor_output_parser(self.code.get_value())
+        if not key:
+            # Random key: a new widget each time, nothing to carry over
+            self._parser = editor_output_parser(self.code.get_value())
+        else:
+            # Kept in session state so event ids are deduplicated across
+            # reruns, not just within one: otherwise the last event fires
+            # again on each rerun
+            parser_key = f"_parser_{key}"
+            if parser_key not in state:
+                state[parser_key] = editor_output_parser(self.code.get_value())
+            self._parser = state[parser_key]
+
+    # --- static code_editor() parameters ---------------------------------
+    # Built once and shared by every instance; only lang/key/height vary.
+
+    # Single Run button, styled similarly to the original notebook
+    _BUTTONS = [
+        {
+            "name": "Run",
+            "feather": "Play",
+            "iconSize": "20px",
+            "primary": True,
+            "hasText": False,
+            "alwaysOn": True,
+            "showWithIcon": True,
+            "commands": [["response", "run"]],
+            "style": {
+                "bottom": "0px",
+                "right": "0px",
+                "fontSize": "14px",
+            },
+        }
+    ]
+    _OPTIONS = {
+        "showLineNumbers": True,
+    }
+    _PROPS = {
+        "enableBasicAutocompletion": False,
+        "enableLiveAutocompletion": False,
+        "enableSnippets": False,
+        "style": {
+            "borderRadius": "0px 0px 0px 0px",
+        },
+    }
 
     # --- internal helpers -------------------------------------------------
 
-    def _buttons(self):
-        """Single Run button, styled similarly to the original notebook."""
-        return [
-            {
-                "name": "Run",
-                "feather": "Play",
-                "iconSize": "20px",
-                "primary": True,
-                "hasText": False,
-                "alwaysOn": True,
-                "showWithIcon": True,
-                "commands": [["response", "run"]],
-                "style": {
-                    "bottom": "0px",
-                    "right": "0px",
-                    "fontSize": "14px",
-                },
-            }
-        ]
-
     def get_params(self) -> dict:
         """Build kwargs passed to code_editor()."""
-        params = dict(
-            lang=self.lang,
-            key=self.key,
-            buttons=self._buttons(),
-            options={
-                "showLineNumbers": True,
-            },
-            props={
-                "enableBasicAutocompletion": False,
-                "enableLiveAutocompletion": False,
-                "enableSnippets": False,
-                "style": {
-                    "borderRadius": "0px 0px 0px 0px",
-                },
-            },
+        return {
+            "lang": self.lang,
+            "key": self.key,
+            "buttons": Editor._BUTTONS,
+            "options": Editor._OPTIONS,
+            "props": Editor._PROPS,
             # Same min/max so the editor has fixed height and scrolls after that
-            height=[self.min_lines, self.max_lines],
-        )
-        return params
+            "height": [self.min_lines, self.max_lines],
+        }
     
     def get_output(self, output):
         """
@@ -182,4 +313,4 @@ class Editor:
         self.event = event
 
 
-__all__ = ["state", "Code", "Editor"]
+__all__ = ["state", "Code", "Editor", "autosave", "autosave_flush_now", "read_text_cached"]
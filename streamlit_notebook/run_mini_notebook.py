@@ -1,10 +1,10 @@
-import io
-import os
-import traceback
+from collections import OrderedDict
+from contextlib import redirect_stdout, redirect_stderr
 
 import streamlit as st
+import streamlit.components.v1 as components
 
-from notebook_imports import state, Code, Editor
+from notebook_imports import state, Code, Editor, autosave, autosave_flush_now, read_text_cached
 
 st.set_page_config(page_title="Mini notebook", layout="wide")
 
@@ -18,6 +18,9 @@ max_lines = 20
 # Visible lines for the MARKDOWN editor before scrolling
 max_lines_markdown = 25
 
+# Keep (and display) only the last characters of stdout / stderr
+MAX_OUTPUT_CHARS = 65536
+
 # -------------------------------------------------------------------
 # Autosave configuration
 # -------------------------------------------------------------------
@@ -32,15 +35,53 @@ AUTOLOAD_ON_START = True
 CODE_AUTOSAVE_PATH = ".mini_notebook_code.py"
 MARKDOWN_AUTOSAVE_PATH = ".mini_notebook_notes.md"
 
-# Optional markdown->HTML converter for nicer, scrollable preview
-try:
-    import markdown as _md_lib
 
-    def _md_to_html(text: str) -> str:
-        return _md_lib.markdown(text, extensions=["fenced_code", "tables"])
-except Exception:  # optional dependency
-    _md_lib = None
-    _md_to_html = None
+# -------------------------------------------------------------------
+# Markdown rendering
+# -------------------------------------------------------------------
+
+@st.cache_resource(show_spinner=False)
+def _get_md_renderer():
+    """
+    Optional markdown->HTML converter for nicer, scrollable preview.
+
+    Prefer markdown-it-py (a streamlit dependency via rich, and much faster),
+    fall back to python-markdown. Returns None if neither is installed.
+    Probed on first use of markdown mode, once per process.
+    """
+    try:
+        from markdown_it import MarkdownIt
+
+        return MarkdownIt("commonmark").enable("table").render
+    except Exception:  # optional dependency
+        pass
+    try:
+        import threading
+
+        import markdown as md_lib
+    except Exception:
+        return None
+
+    # Build the extension pipeline once; the instance is stateful, and
+    # sessions run on separate threads, so conversions are serialized.
+    md = md_lib.Markdown(extensions=["fenced_code", "tables"])
+    lock = threading.Lock()
+
+    def md_to_html(text: str) -> str:
+        with lock:
+            return md.reset().convert(text)
+
+    return md_to_html
+
+
+# Scrollable box around the rendered HTML; only the body is spliced in
+_PREVIEW_TEMPLATE = '<div style="max-height:{h}px;overflow-y:auto;padding:0.5rem;">{body}</div>'
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _md_to_html_cached(text: str) -> str:
+    """Markdown -> HTML, memoized across reruns and sessions."""
+    return _get_md_renderer()(text)
 
 
 # -------------------------------------------------------------------
@@ -48,18 +89,27 @@ except Exception:  # optional dependency
 # -------------------------------------------------------------------
 
 def _autosave(path: str, text: str) -> None:
-    """Save text to a file, if autosave is enabled."""
+    """
+    Save text to a file, if autosave is enabled.
+
+    Writes are debounced: rapid successive calls only hit the disk once,
+    with the latest text.
+    """
     if not ENABLE_AUTOSAVE or not path:
         return
-    try:
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(text)
-    except Exception as e:
+    error = autosave(path, text)
+    if error is not None:
         # Non-fatal; just let the user know
         try:
-            st.toast(f"Autosave failed: {e}", icon="⚠️")
+            st.toast(f"Autosave failed: {error}", icon="⚠️")
         except Exception:
-            st.warning(f"Autosave failed: {e}")
+            st.warning(f"Autosave failed: {error}")
+
+
+def _autosave_flush_now() -> None:
+    """Critical checkpoint: write any pending autosave immediately."""
+    if ENABLE_AUTOSAVE:
+        autosave_flush_now()
 
 
 def _autoload_if_needed(path: str, default_text: str) -> str:
@@ -69,12 +119,14 @@ def _autoload_if_needed(path: str, default_text: str) -> str:
     If AUTOLOAD_ON_START is True and the file exists, load it.
     Otherwise, fall back to default_text.
     """
-    if AUTOLOAD_ON_START and path and os.path.exists(path):
+    if AUTOLOAD_ON_START and path:
+        # A save from a session that just ended (e.g. browser refresh right
+        # after Run) may still be queued; make sure it's on disk first
+        _autosave_flush_now()
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read()
+            return read_text_cached(path)
         except Exception:
-            # If anything goes wrong, just use the default
+            # Missing file or anything else going wrong: use the default
             return default_text
     return default_text
 
@@ -83,47 +135,93 @@ def _autoload_if_needed(path: str, default_text: str) -> str:
 # Code mode helpers
 # -------------------------------------------------------------------
 
+_DEFAULT_CODE = "print('Hello from mini notebook!')"
+
+
+@st.cache_resource(show_spinner=False)
+def _default_compiled():
+    """Code object for the default cell, compiled once per process."""
+    return compile(_DEFAULT_CODE, "<mini_notebook_cell>", "exec")
+
+
 def _ensure_code_state():
     """Initialize session_state entries for code mode."""
+    import io
+
     if "mini_code_code" not in state:
-        initial = _autoload_if_needed(
-            CODE_AUTOSAVE_PATH,
-            "print('Hello from mini notebook!')",
-        )
+        initial = _autoload_if_needed(CODE_AUTOSAVE_PATH, _DEFAULT_CODE)
         state.mini_code_code = Code(initial)
-
-    if "mini_code_ns" not in state:
-        # Persistent namespace across runs
-        state.mini_code_ns = {}
-
-    if "mini_code_stdout" not in state:
-        state.mini_code_stdout = ""
-    if "mini_code_stderr" not in state:
-        state.mini_code_stderr = ""
-    if "mini_code_exception" not in state:
-        state.mini_code_exception = ""
+        if initial == _DEFAULT_CODE:
+            # First Run of the untouched example skips compilation
+            state.setdefault("mini_code_compiled", OrderedDict())[_DEFAULT_CODE] = _default_compiled()
+
+    # Persistent namespace across runs
+    state.setdefault("mini_code_ns", {})
+    state.setdefault("mini_code_stdout", "")
+    state.setdefault("mini_code_stderr", "")
+    state.setdefault("mini_code_exception", "")
+    # source -> code object, most recently used last
+    state.setdefault("mini_code_compiled", OrderedDict())
+    # Capture buffers, reused (and emptied) on every run
+    if "mini_code_out_buf" not in state:
+        state.mini_code_out_buf = io.StringIO()
+    if "mini_code_err_buf" not in state:
+        state.mini_code_err_buf = io.StringIO()
+
+
+def _tail(s: str, n: int = MAX_OUTPUT_CHARS) -> str:
+    """Return the last `n` characters of `s`, noting how much was dropped."""
+    if len(s) <= n:
+        return s
+    return f"... [truncated {len(s) - n} characters]\n" + s[-n:]
+
+
+# How many compiled sources to keep per session
+COMPILED_CACHE_SIZE = 32
+
+
+def _compile_cached(src: str):
+    """Compile `src`, reusing the code object if it was compiled before."""
+    cache: OrderedDict = state.mini_code_compiled
+    code = cache.get(src)
+    if code is None:
+        code = compile(src, "<mini_notebook_cell>", "exec")
+        cache[src] = code
+        if len(cache) > COMPILED_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(src)
+    return code
 
 
 def _run_code():
     """Execute the current code in a persistent namespace and capture output."""
+    # Only needed in code mode; markdown-only sessions never import them
+    import sys
+    import traceback
+
     code_obj: Code = state.mini_code_code
     src = code_obj.get_value()
     ns = state.mini_code_ns
 
-    buf_out = io.StringIO()
-    buf_err = io.StringIO()
+    buf_out = state.mini_code_out_buf
+    buf_err = state.mini_code_err_buf
 
     try:
-        from contextlib import redirect_stdout, redirect_stderr
-
         with redirect_stdout(buf_out), redirect_stderr(buf_err):
-            exec(compile(src, "<mini_notebook_cell>", "exec"), ns)
+            exec(_compile_cached(src), ns)
         state.mini_code_exception = ""
     except Exception:
         state.mini_code_exception = traceback.format_exc()
-
-    state.mini_code_stdout = buf_out.getvalue()
-    state.mini_code_stderr = buf_err.getvalue()
+        # Don't let the failed run's frame locals stay pinned by the traceback
+        traceback.clear_frames(sys.exc_info()[2])
+    finally:
+        state.mini_code_stdout = _tail(buf_out.getvalue())
+        state.mini_code_stderr = _tail(buf_err.getvalue())
+        # Only the tail is kept in state; release the full output
+        for buf in (buf_out, buf_err):
+            buf.seek(0)
+            buf.truncate()
 
     # Autosave current code source
     _autosave(CODE_AUTOSAVE_PATH, src)
@@ -135,6 +233,14 @@ def show_code_mode():
     _ensure_code_state()
     code_obj: Code = state.mini_code_code
 
+    # Variables accumulate across runs; let the user drop them
+    if st.sidebar.button(
+        "Reset namespace",
+        help="Forget all variables and imports defined by previous runs.",
+    ):
+        state.mini_code_ns = {}
+        st.toast("Namespace cleared.")
+
     editor = Editor(
         code=code_obj,
         key="mini_code_editor",
@@ -176,14 +282,11 @@ def _ensure_markdown_state():
         )
         state.mini_md_code = Code(initial)
 
-    if "mini_md_last_run" not in state:
-        # On first use, last_run = current text (implicitly "auto-run" for preview)
-        state.mini_md_last_run = state.mini_md_code.get_value()
+    # On first use, last_run = current text (implicitly "auto-run" for preview)
+    state.setdefault("mini_md_last_run", state.mini_md_code.get_value())
 
 
 def show_markdown_mode():
-    import streamlit.components.v1 as components
-
     st.title("Mini notebook – Markdown notepad")
 
     _ensure_markdown_state()
@@ -218,28 +321,23 @@ def show_markdown_mode():
         lines = max_lines_markdown or 15
         preview_height = lines * line_height_px
 
-        if _md_to_html is not None:
-            html = _md_to_html(text)
+        if _get_md_renderer() is not None:
+            # Rebuild the HTML only when the previewed text changed
+            if state.get("mini_md_preview_src") is not text:
+                state.mini_md_preview_src = text
+                state.mini_md_preview_html = _md_to_html_cached(text)
             components.html(
-                f"""
-                <div style="
-                    max-height: {preview_height}px;
-                    overflow-y: auto;
-                    padding: 0.5rem;
-                ">
-                    {html}
-                </div>
-                """,
+                _PREVIEW_TEMPLATE.format(h=preview_height, body=state.mini_md_preview_html),
                 height=preview_height + 40,
                 scrolling=False,
             )
         else:
-            # Fallback if python-markdown isn't installed:
+            # Fallback if no markdown library is installed:
             # we still show the markdown, but Streamlit controls the height.
             st.warning(
-                "Optional dependency `markdown` is not installed – "
+                "Optional dependency `markdown-it-py` is not installed – "
                 "preview will grow with content instead of scrolling.\n\n"
-                "Install it with: `pip install markdown` to enable the scroll box."
+                "Install it with: `pip install markdown-it-py` to enable the scroll box."
             )
             st.markdown(text)
 
@@ -254,6 +352,7 @@ def main():
         "Notebook mode",                   # label
         ("Code cell", "Markdown notepad"), # options
         key="mini_notebook_mode",          # unique key so it won't clash
+        on_change=_autosave_flush_now,     # don't leave writes pending across modes
     )
 
     if choice == "Code cell":